@@ -1,32 +1,137 @@
 from pathlib import Path
-import json
-import csv
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import orjson
+import mmap
+import os
+import hashlib
+import codecs
+import pickle
 from re import A
+import numpy as np
+import pandas as pd
+from numba import njit, prange
 from torch.utils.data import Dataset
 import string
 import matplotlib.pyplot as plt
 from tqdm import tqdm
 
 
+# Files smaller than this are read directly, mapping them costs more than the read itself
+MMAP_MIN_SIZE = 64 * 1024
+# Only the file reads release the GIL (orjson holds it while building objects), so threads overlap the I/O
+JSON_LOAD_WORKERS = 32
+# stat() releases the GIL, so existence checks on slow filesystems overlap well in threads
+STAT_WORKERS = 64
+# Bump when the layout of the pickled sample index changes
+INDEX_VERSION = 2
+# Maps every punctuation character to a space, used when counting words
+_PUNCT_TABLE = str.maketrans(string.punctuation, ' '*len(string.punctuation))
+
+
+def _load_json(path):
+    return orjson.loads(path.read_bytes())
+
+
+def _scan_txt_files(root):
+    """Return the set of '/'-separated paths of all .txt files under `root`, relative to it.
+
+    Symlinked directories are followed like `Path.is_file()` would, each real directory is walked once.
+    """
+    found = set()
+    root_stat = os.stat(root)
+    visited = {(root_stat.st_dev, root_stat.st_ino)}
+    stack = ['']
+    while stack:
+        prefix = stack.pop()
+        with os.scandir(os.path.join(root, prefix)) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if entry.is_symlink():
+                        # Guard against symlink cycles
+                        entry_stat = entry.stat()
+                        key = (entry_stat.st_dev, entry_stat.st_ino)
+                        if key in visited:
+                            continue
+                        visited.add(key)
+                    stack.append(prefix + entry.name + '/')
+                elif entry.name.endswith('.txt') and entry.is_file():
+                    found.add(prefix + entry.name)
+    return found
+
+
 class BenYehudaDataset(Dataset):
     def __init__(self, 
                  pseudocatalogue_path: str,
                  authors_dir: str,
                  txt_dir: str,
-                 encoding: str = 'utf-8'):
-        self.samples = []
+                 encoding: str = 'utf-8',
+                 use_mmap: bool = True,
+                 cache_dir: Optional[str] = None,
+                 arena_dir: Optional[str] = None,
+                 cache_size: int = 4096,
+                 return_bytes: bool = False,
+                 scan_txt_dir: bool = True):
         self.author_years = {}
         self.txt_dir = Path(txt_dir)
+        self._txt_dir_str = str(self.txt_dir)
         self.encoding = encoding
+        self.use_mmap = use_mmap
+        # Return raw encoded bytes instead of str, for tokenizers that consume bytes directly
+        self.return_bytes = return_bytes
+        # Check txt existence with one walk of txt_dir, or with parallel stat() calls when walking is slow (network filesystems)
+        self.scan_txt_dir = scan_txt_dir
+        # The arena and offsets are mapped on first use, so they can be re-mapped after unpickling in a worker
+        self._arena_file = None
+        self._offsets_file = None
+        self._arena = None
+        self._offsets = None
+        # Texts of recently used samples, evicted in LRU order past cache_size
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
 
         authors_dir = Path(authors_dir)
         pseudocatalogue_path = Path(pseudocatalogue_path)
 
+        index_file = None
+        if cache_dir is not None:
+            index_file = self._index_file(Path(cache_dir), pseudocatalogue_path, authors_dir)
+        if index_file is not None and index_file.is_file():
+            with index_file.open('rb') as f:
+                self.paths, self.birth, self.death, self.author_years = pickle.load(f)
+        else:
+            self._load_author_years(authors_dir)
+            self._load_catalogue(pseudocatalogue_path)
+            if index_file is not None:
+                tmp_file = index_file.with_suffix('.tmp')
+                with tmp_file.open('wb') as f:
+                    pickle.dump((self.paths, self.birth, self.death, self.author_years), f,
+                                protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_file, index_file)
+
+        # The arena is a full copy of the corpus, so it is opt-in separately from the small index cache
+        if arena_dir is not None:
+            self.build_arena(arena_dir)
+
+    def _index_file(self, cache_path: Path, pseudocatalogue_path: Path, authors_dir: Path) -> Path:
+        """Path of the pickled sample index, keyed by the inputs it was built from."""
+        cache_path.mkdir(parents=True, exist_ok=True)
+        key = ':'.join([
+            str(INDEX_VERSION),
+            str(pseudocatalogue_path.resolve()), str(pseudocatalogue_path.stat().st_mtime_ns),
+            str(authors_dir.resolve()), str(authors_dir.stat().st_mtime_ns),
+            str(self.txt_dir.resolve()), self.encoding,
+        ])
+        sig = hashlib.md5(key.encode()).hexdigest()
+        return cache_path / f'index_{sig}.pkl'
+
+    def _load_author_years(self, authors_dir: Path):
         invalid_years_counter = 0
         # Load author birth/death years
-        for author_file in authors_dir.glob('author_*.json'):
-            with author_file.open(encoding=encoding) as f:
-                data = json.load(f)
+        author_files = list(authors_dir.glob('author_*.json'))
+        with ThreadPoolExecutor(JSON_LOAD_WORKERS) as executor:
+            for data in executor.map(_load_json, author_files):
                 author_id = int(data['id'])
                 metadata = data['metadata']
                 person = metadata.get('person', {})
@@ -44,83 +149,283 @@ class BenYehudaDataset(Dataset):
                     self.author_years[author_name] = (int(birth), int(death))
         print(f"Could not parse birth or death years for {invalid_years_counter} authors")
 
-        # Read pseudocatalogue.csv
-        with pseudocatalogue_path.open(encoding=encoding) as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                path = row.get('path', '').strip()
-                author_name = row.get("authors")
-                author_id = int(path.split('/')[1][1:])
-                if not author_name or not path:
-                    continue
-                if path.startswith('/'):
-                    path = path[1:]
-                txt_path = self.txt_dir / f'{path}.txt'
-                if author_name in self.author_years and txt_path.is_file():
-                    self.samples.append((txt_path, self.author_years[author_name]))
-                else:
-                    pass
-                    # print(f"Skipping {txt_path} because it doesn't exist or author_id {author_id} is not in author_years")
+    def _load_catalogue(self, pseudocatalogue_path: Path):
+        # Read pseudocatalogue.csv, keeping the years in flat arrays alongside the paths
+        catalogue = pd.read_csv(pseudocatalogue_path, encoding=self.encoding, usecols=['path', 'authors'],
+                                dtype=str, keep_default_na=False, engine='c')
+        paths = catalogue['path'].str.strip().str.lstrip('/')
+        authors = catalogue['authors']
+        known = (paths != '') & authors.isin(list(self.author_years))
+        paths, authors = paths[known], authors[known]
+        rel_paths = paths + '.txt'
+        if self.scan_txt_dir:
+            # One directory walk instead of a stat() per catalogue row
+            existing = _scan_txt_files(self.txt_dir)
+            exists = rel_paths.isin(existing).to_numpy()
+        else:
+            full_paths = [os.path.join(self._txt_dir_str, rel_path) for rel_path in rel_paths]
+            with ThreadPoolExecutor(STAT_WORKERS) as executor:
+                exists = np.fromiter(executor.map(os.path.isfile, full_paths), dtype=bool, count=len(full_paths))
+
+        # Paths are kept as plain strings relative to txt_dir, joined only when a file is opened
+        self.paths = rel_paths[exists].tolist()
+        years = authors[exists].map(self.author_years)
+        self.birth = np.fromiter((b for b, _ in years), dtype=np.int16, count=len(years))
+        self.death = np.fromiter((d for _, d in years), dtype=np.int16, count=len(years))
+
+    def build_arena(self, cache_path: str):
+        """Concatenate all sample texts into a single file and memory map it.
+
+        The arena is written once to `cache_path` next to an (N, 2) table of
+        start/end byte offsets, and reused as long as the sample list is unchanged.
+        """
+        cache_path = Path(cache_path)
+        cache_path.mkdir(parents=True, exist_ok=True)
+        sig = hashlib.md5('\n'.join([self._txt_dir_str] + self.paths).encode()).hexdigest()
+        arena_file = cache_path / f'corpus_{sig}.bin'
+        offsets_file = cache_path / f'offsets_{sig}.npy'
+
+        if not (arena_file.is_file() and offsets_file.is_file()):
+            offsets = np.empty((len(self.paths), 2), dtype=np.int64)
+            position = 0
+            tmp_file = arena_file.with_suffix('.tmp')
+            with tmp_file.open('wb') as out:
+                for i, rel_path in enumerate(tqdm(self.paths, desc='Building arena')):
+                    with open(os.path.join(self._txt_dir_str, rel_path), 'rb') as f:
+                        data = f.read()
+                    out.write(data)
+                    offsets[i] = (position, position + len(data))
+                    position += len(data)
+            np.save(offsets_file, offsets)
+            os.replace(tmp_file, arena_file)
+
+        self._arena_file = arena_file
+        self._offsets_file = offsets_file
+        self._map_arena()
+
+    def _map_arena(self):
+        self._offsets = np.load(self._offsets_file, mmap_mode='r')
+        if self._arena_file.stat().st_size == 0:
+            # An empty file cannot be mapped
+            self._arena = b''
+        else:
+            with self._arena_file.open('rb') as f:
+                self._arena = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def arena(self):
+        if self._arena is None and self._arena_file is not None:
+            self._map_arena()
+        return self._arena
+
+    @property
+    def offsets(self):
+        if self._offsets is None and self._offsets_file is not None:
+            self._map_arena()
+        return self._offsets
+
+    def __getstate__(self):
+        # mmap objects cannot be pickled, e.g. when DataLoader spawns workers; they are re-mapped lazily instead
+        state = self.__dict__.copy()
+        state['_arena'] = None
+        state['_offsets'] = None
+        state['_cache'] = OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
 
     def __len__(self):
-        return len(self.samples)
+        return len(self.paths)
+
+    def _read_bytes(self, rel_path):
+        fd = os.open(os.path.join(self._txt_dir_str, rel_path), os.O_RDONLY)
+        try:
+            size = os.fstat(fd).st_size
+            if not self.use_mmap or size < MMAP_MIN_SIZE:
+                with os.fdopen(fd, 'rb', closefd=False) as f:
+                    return f.read()
+            # Map the file so workers share the page cache instead of copying through read()
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+                return mm[:]
+        finally:
+            os.close(fd)
+
+    def _decode(self, data):
+        # Match text-mode open(): universal newlines turn \r\n and lone \r into \n
+        return data.decode(self.encoding).replace('\r\n', '\n').replace('\r', '\n')
 
     def __getitem__(self, idx):
-        txt_path, years = self.samples[idx]
-        with txt_path.open(encoding=self.encoding) as f:
-            text = f.read()
-        return text, years
+        if self.return_bytes and self.arena is not None:
+            # Slicing the arena is a single copy out of the page cache, there is nothing worth caching
+            start, end = self.offsets[idx]
+            return self.arena[start:end], (int(self.birth[idx]), int(self.death[idx]))
+
+        text = self._cache.get(idx)
+        if text is not None:
+            self._cache.move_to_end(idx)
+        else:
+            if self.arena is not None:
+                start, end = self.offsets[idx]
+                text = self._decode(self.arena[start:end])
+            else:
+                text = self._read_bytes(self.paths[idx])
+                if not self.return_bytes:
+                    text = self._decode(text)
+            if self._cache_size > 0:
+                self._cache[idx] = text
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+        return text, (int(self.birth[idx]), int(self.death[idx]))
+
+# Number of bars per histogram panel, enough to show the shape without drawing thousands of patches
+HISTOGRAM_BINS = 30
+
+
+def _year_bins(years):
+    # Integer-aligned edges, so each bin covers a whole number of years
+    step = max(1, (int(years.max()) - int(years.min()) + 1) // HISTOGRAM_BINS)
+    return np.arange(int(years.min()), int(years.max()) + step + 1, step)
+
+def _plot_histogram(ax, counts, edges, color, title, xlabel):
+    # Bar outlines would merge into a solid block once bars get narrower than a few pixels
+    edgecolor = 'black' if len(counts) <= 2 * HISTOGRAM_BINS else 'none'
+    ax.bar(edges[:-1], counts, width=np.diff(edges), align='edge', color=color, edgecolor=edgecolor)
+    ax.set_yscale('log')
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel('Count')
 
 def plot_dataset_statistics(text_lengths, birth_years, death_years):
-    plt.figure(figsize=(15, 4))
-    plt.subplot(1, 3, 1)
-    text_lengths = list(map(lambda x: x / 1000, text_lengths))
-    plt.hist(text_lengths, bins=50, color='skyblue', edgecolor='black')
-    plt.yscale('log')
-    plt.title('Text Length Distribution')
-    plt.xlabel('Text Length (thousand characters)')
-    plt.ylabel('Count')
-
-    plt.subplot(1, 3, 2)
-    plt.hist(birth_years, bins=30, color='lightgreen', edgecolor='black')
-    plt.yscale('log')
-    plt.title('Birth Year Distribution')
-    plt.xlabel('Birth Year')
-    plt.ylabel('Count')
-
-    plt.subplot(1, 3, 3)
-    plt.hist(death_years, bins=30, color='salmon', edgecolor='black')
-    plt.yscale('log')
-    plt.title('Death Year Distribution')
-    plt.xlabel('Death Year')
-    plt.ylabel('Count')
-
-    plt.tight_layout()
+    # Bin with NumPy once and only draw the bars, instead of letting plt.hist bin every series
+    fig, axes = plt.subplots(1, 3, figsize=(15, 4))
+    counts, edges = np.histogram(np.asarray(text_lengths) / 1000, bins=50)
+    _plot_histogram(axes[0], counts, edges, 'skyblue', 'Text Length Distribution', 'Text Length (thousand characters)')
+
+    birth_years = np.asarray(birth_years)
+    counts, edges = np.histogram(birth_years, bins=_year_bins(birth_years))
+    _plot_histogram(axes[1], counts, edges, 'lightgreen', 'Birth Year Distribution', 'Birth Year')
+
+    death_years = np.asarray(death_years)
+    counts, edges = np.histogram(death_years, bins=_year_bins(death_years))
+    _plot_histogram(axes[2], counts, edges, 'salmon', 'Death Year Distribution', 'Death Year')
+
+    fig.tight_layout()
     plt.show()
 
+def _is_word_separator(char):
+    return char in string.punctuation or char.isspace()
+
+def _arena_byte_classes(encoding):
+    """Describe how the arena kernel can measure text stored in `encoding`.
+
+    Returns `(is_utf8, is_sep, wide_sep)`, where `is_sep` is a 256-entry table of the bytes that
+    end a word and `wide_sep` marks the non-ASCII separator code points for UTF-8, or None when
+    bytes don't map to characters simply enough and samples have to be decoded.
+    Only two cases qualify: UTF-8, whose multi-byte sequences never contain ASCII bytes, and
+    ASCII-compatible single-byte encodings such as cp1255. Anything else (utf-16, utf-8-sig
+    with its BOM, multi-byte CJK codecs) falls back to decoding.
+    """
+    is_sep = np.zeros(256, dtype=np.bool_)
+    if codecs.lookup(encoding).name == 'utf-8':
+        for b in range(128):
+            is_sep[b] = _is_word_separator(chr(b))
+        # str.split() also splits on Unicode whitespace such as NBSP, all of it below U+3001
+        wide_sep = np.zeros(0x3001, dtype=np.bool_)
+        for cp in range(0x80, len(wide_sep)):
+            wide_sep[cp] = _is_word_separator(chr(cp))
+        return True, is_sep, wide_sep
+
+    ascii_bytes = bytes(range(128))
+    try:
+        if ascii_bytes.decode(encoding) != ascii_bytes.decode('ascii'):
+            return None
+    except UnicodeDecodeError:
+        return None
+    # An incremental decoder buffers lead bytes of multi-byte sequences instead of returning a character
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for b in range(256):
+        char = decoder.decode(bytes([b]))
+        if len(char) != 1:
+            return None
+        is_sep[b] = _is_word_separator(char)
+    return False, is_sep, np.zeros(1, dtype=np.bool_)
+
+
+@njit(parallel=True, cache=True)
+def _scan_arena(buf, offsets, is_sep, is_utf8, wide_sep):
+    """Per-sample word counts, UTF-8 continuation byte counts and CRLF pair counts over the arena."""
+    n = offsets.shape[0]
+    words = np.zeros(n, dtype=np.int64)
+    continuations = np.zeros(n, dtype=np.int64)
+    crlf = np.zeros(n, dtype=np.int64)
+    for i in prange(n):
+        in_word = False
+        start = offsets[i, 0]
+        end = offsets[i, 1]
+        for j in range(start, end):
+            c = buf[j]
+            if c == 0x0A and j > start and buf[j - 1] == 0x0D:
+                crlf[i] += 1
+            if is_utf8 and c >= 0x80:
+                if c & 0xC0 == 0x80:
+                    # Part of the character its lead byte already classified
+                    continuations[i] += 1
+                    continue
+                # Decode the code point of the multi-byte sequence to look up Unicode whitespace
+                if c < 0xE0:
+                    length, cp = 2, int(c) & 0x1F
+                elif c < 0xF0:
+                    length, cp = 3, int(c) & 0x0F
+                else:
+                    length, cp = 4, int(c) & 0x07
+                for k in range(1, length):
+                    if j + k < end:
+                        cp = (cp << 6) | (int(buf[j + k]) & 0x3F)
+                sep = cp < wide_sep.shape[0] and wide_sep[cp]
+            else:
+                sep = is_sep[c]
+            if sep:
+                in_word = False
+            elif not in_word:
+                in_word = True
+                words[i] += 1
+    return words, continuations, crlf
+
 def print_dataset_statistics(dataset):
     print(f"Number of samples: {len(dataset)}")
-    text_lengths = []
-    birth_years = []
-    death_years = []
-    total_words = 0
-    total_chars = 0
-    for i in tqdm(range(len(dataset))):
-        text, years = dataset[i]
-        birth, death = years
-        birth_years.append(birth)
-        death_years.append(death)
-        text_lengths.append(len(text))
-        text_no_punct = text.translate(str.maketrans(string.punctuation, ' '*len(string.punctuation)))
-        total_words += len([tok for tok in text_no_punct.split() if tok.strip()])
-        total_chars += len(text)
-    print(f"Text lengths: min={min(text_lengths)}, max={max(text_lengths)}, mean={sum(text_lengths)/len(text_lengths):.2f}")
-    print(f"Birth years: min={min(birth_years)}, max={max(birth_years)}, mean={sum(birth_years)/len(birth_years):.2f}")
-    print(f"Death years: min={min(death_years)}, max={max(death_years)}, mean={sum(death_years)/len(death_years):.2f}")
+    byte_classes = _arena_byte_classes(dataset.encoding) if dataset.arena is not None else None
+    if byte_classes is not None:
+        # Work on the raw arena bytes, lengths come from the offset table without reading any text
+        is_utf8, is_sep, wide_sep = byte_classes
+        offsets = np.asarray(dataset.offsets)
+        buf = np.frombuffer(dataset.arena, dtype=np.uint8)
+        words, continuations, crlf = _scan_arena(buf, offsets, is_sep, is_utf8, wide_sep)
+        # Samples are decoded with universal newlines, where every \r\n pair is a single character
+        text_lengths = offsets[:, 1] - offsets[:, 0] - crlf
+        if is_utf8:
+            # Every UTF-8 character has exactly one non-continuation byte
+            text_lengths = text_lengths - continuations
+        total_words = int(words.sum())
+    else:
+        text_lengths = []
+        total_words = 0
+        for i in tqdm(range(len(dataset))):
+            text, _ = dataset[i]
+            if dataset.return_bytes:
+                text = dataset._decode(text)
+            text_lengths.append(len(text))
+            text_no_punct = text.translate(_PUNCT_TABLE)
+            total_words += len([tok for tok in text_no_punct.split() if tok.strip()])
+        text_lengths = np.array(text_lengths, dtype=np.int64)
+    total_chars = int(text_lengths.sum())
+    print(f"Text lengths: min={text_lengths.min()}, max={text_lengths.max()}, mean={text_lengths.mean():.2f}")
+    print(f"Birth years: min={dataset.birth.min()}, max={dataset.birth.max()}, mean={dataset.birth.mean():.2f}")
+    print(f"Death years: min={dataset.death.min()}, max={dataset.death.max()}, mean={dataset.death.mean():.2f}")
     print(f"Number of unique authors: {len(set(dataset.author_years.keys()))}")
     print(f"Total number of words: {total_words}")
     print(f"Total number of characters: {total_chars}")
-    plot_dataset_statistics(text_lengths, birth_years, death_years)
+    plot_dataset_statistics(text_lengths, dataset.birth, dataset.death)
 
 if __name__ == "__main__":
     dataset = BenYehudaDataset(
@@ -1,17 +1,23 @@
-import requests
-import json
+import asyncio
+import httpx
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Optional, List, Iterator, Set
 import os
 from dotenv import load_dotenv
 from pathlib import Path
-import time
 from tqdm import tqdm
 import logging
+from scraper_common import make_client, open_for_append, load_progress, compact_progress
 
 class BenYehudaAuthorScraper:
     """API client for scraping authors from the Ben Yehuda Project."""
     
     BASE_URL = "https://benyehuda.org/api/v1"
+    LOAD_WORKERS = 32  # Number of threads used to read work files, only the reads overlap since orjson holds the GIL
+    MAX_CONCURRENCY = 10  # Number of author requests in flight at once
+    MAX_CONNECTIONS = 20  # Size of the HTTP connection pool
+    REQUEST_TIMEOUT = 60.0  # Seconds
     
     def __init__(self, api_key: Optional[str] = None, output_dir: str = "benyehuda_data"):
         """Initialize the API client.
@@ -41,10 +47,11 @@ class BenYehudaAuthorScraper:
         )
         self.logger = logging.getLogger(__name__)
 
-    def get_author(self, author_id: int, detail: str = 'enriched') -> Dict:
+    async def get_author(self, client: httpx.AsyncClient, author_id: int, detail: str = 'enriched') -> Dict:
         """Get details of a specific author.
         
         Args:
+            client: HTTP client to send the request with
             author_id: The ID of the author to retrieve
             detail: One of 'metadata', 'texts', or 'enriched'
             
@@ -56,13 +63,15 @@ class BenYehudaAuthorScraper:
             'author_detail': detail
         }
         
-        response = requests.get(f"{self.BASE_URL}/authorities/{author_id}", params=params)
+        response = await client.get(f"{self.BASE_URL}/authorities/{author_id}", params=params)
         response.raise_for_status()
-        return response.json()
+        return orjson.loads(response.content)
 
     def collect_author_ids(self) -> Set[int]:
         """Collect all author IDs from the works directory.
         
+        Works are read from works.jsonl, and from the per-work files written by older versions of the scraper.
+        
         Returns:
             Set[int]: Set of unique author IDs
         """
@@ -75,38 +84,108 @@ class BenYehudaAuthorScraper:
             
         self.logger.info("Collecting author IDs from works...")
         
-        for work_file in works_dir.glob("work_*.json"):
-            try:
-                with open(work_file, 'r', encoding='utf-8') as f:
-                    work = json.load(f)
-                    # Get author IDs from metadata
+        works_file = works_dir / "works.jsonl"
+        if works_file.exists():
+            with open(works_file, 'rb') as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        work = orjson.loads(line)
+                    except orjson.JSONDecodeError as e:
+                        self.logger.error(f"Error processing {works_file} line {line_number}: {str(e)}")
+                        continue
                     if 'metadata' in work and 'author_ids' in work['metadata']:
                         author_ids.update(work['metadata']['author_ids'])
+        
+        def load_work(work_file: Path) -> Optional[Dict]:
+            try:
+                return orjson.loads(work_file.read_bytes())
             except Exception as e:
                 self.logger.error(f"Error processing {work_file}: {str(e)}")
-                continue
+                return None
+        
+        work_files = list(works_dir.glob("work_*.json"))
+        with ThreadPoolExecutor(self.LOAD_WORKERS) as executor:
+            for work in executor.map(load_work, work_files):
+                # Get author IDs from metadata
+                if work and 'metadata' in work and 'author_ids' in work['metadata']:
+                    author_ids.update(work['metadata']['author_ids'])
                 
         return author_ids
 
-    def save_author(self, author: Dict) -> None:
+    def collect_saved_author_ids(self) -> Set[int]:
+        """Collect the IDs of authors that already have a file in the authors directory.
+        
+        Returns:
+            Set[int]: Set of author IDs saved by previous runs
+        """
+        saved_ids = set()
+        with os.scandir(self.authors_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith("author_") and name.endswith(".json"):
+                    # An empty file is what an interrupted write from an older version leaves behind
+                    if entry.stat().st_size == 0:
+                        continue
+                    try:
+                        saved_ids.add(int(name[len("author_"):-len(".json")]))
+                    except ValueError:
+                        continue
+        return saved_ids
+
+    def save_author(self, author: Dict) -> bool:
         """Save an author to file.
         
         Args:
             author: Author data to save
+            
+        Returns:
+            True if the author file was written, False otherwise
         """
         author_id = author.get('id')
         if not author_id:
             self.logger.warning("Author has no ID, skipping")
-            return
+            return False
             
         author_file = self.authors_dir / f"author_{author_id}.json"
+        # Write to a temporary file first so an interrupted write never leaves a truncated author file behind
+        temp_file = author_file.with_suffix('.tmp')
         try:
-            with open(author_file, 'w', encoding='utf-8') as f:
-                json.dump(author, f, ensure_ascii=False, indent=2)
+            with open(temp_file, 'wb') as f:
+                f.write(orjson.dumps(author, option=orjson.OPT_INDENT_2))
+            os.replace(temp_file, author_file)
+            return True
         except Exception as e:
             self.logger.error(f"Error saving author {author_id}: {str(e)}")
+            temp_file.unlink(missing_ok=True)
+            return False
 
-    def scrape_all_authors(self) -> None:
+    async def scrape_author(self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, author_id: int) -> Optional[int]:
+        """Fetch and save a single author.
+        
+        Args:
+            client: HTTP client to send the request with
+            semaphore: Semaphore bounding the number of concurrent requests
+            author_id: The ID of the author to scrape
+            
+        Returns:
+            The author ID if it was scraped successfully, None otherwise
+        """
+        async with semaphore:
+            try:
+                author_data = await self.get_author(client, author_id)
+                if not self.save_author(author_data):
+                    return None
+                return author_id
+            except Exception as e:
+                self.logger.error(f"Error processing author {author_id}: {str(e)}")
+                return None
+            finally:
+                # Be nice to the API
+                await asyncio.sleep(0.5)
+
+    async def scrape_all_authors(self) -> None:
         """Scrape all authors from the Ben Yehuda Project."""
         self.logger.info("Starting to scrape authors...")
         
@@ -115,49 +194,44 @@ class BenYehudaAuthorScraper:
         total_authors = len(author_ids)
         self.logger.info(f"Found {total_authors} authors to scrape")
         
-        # Create progress file to track progress
+        # Progress is appended to a log as authors are scraped and compacted into the JSON file at the end
         progress_file = self.output_dir / "authors_progress.json"
-        scraped_ids = set()
+        progress_log = self.output_dir / "authors_progress.log"
+        # The log may only be deleted at the end once its IDs have been merged
+        scraped_ids, log_merged = load_progress(progress_file, progress_log, self.logger)
+        self.logger.info(f"Loaded {len(scraped_ids)} previously scraped authors")
         
-        # Load progress if exists
-        if progress_file.exists():
-            try:
-                with open(progress_file, 'r', encoding='utf-8') as f:
-                    scraped_ids = set(json.load(f))
-                self.logger.info(f"Loaded {len(scraped_ids)} previously scraped authors")
-            except Exception as e:
-                self.logger.error(f"Error loading progress file: {str(e)}")
+        # Authors already on disk don't need to be requested again, even if the progress file lost them
+        saved_ids = self.collect_saved_author_ids() - scraped_ids
+        if saved_ids:
+            self.logger.info(f"Found {len(saved_ids)} more authors already saved on disk")
+            scraped_ids.update(saved_ids)
         
+        pending_ids = [author_id for author_id in author_ids if author_id not in scraped_ids]
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENCY)
+        progress_fh = open_for_append(progress_log, drop_partial_line=True)
         try:
-            for author_id in tqdm(author_ids, desc="Scraping authors"):
-                if author_id in scraped_ids:
-                    self.logger.debug(f"Author {author_id} already scraped, skipping")
-                    continue
-                
+            async with make_client(self.MAX_CONNECTIONS, self.REQUEST_TIMEOUT) as client:
+                tasks = [asyncio.create_task(self.scrape_author(client, semaphore, author_id)) for author_id in pending_ids]
                 try:
-                    # Get author details
-                    author_data = self.get_author(author_id)
-                    self.save_author(author_data)
-                    scraped_ids.add(author_id)
-                    
-                    # Update progress file periodically
-                    if len(scraped_ids) % 10 == 0:
-                        with open(progress_file, 'w', encoding='utf-8') as f:
-                            json.dump(list(scraped_ids), f)
-                    
-                except Exception as e:
-                    self.logger.error(f"Error processing author {author_id}: {str(e)}")
-                    continue
-                
-                # Be nice to the API
-                time.sleep(0.5)
+                    for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Scraping authors"):
+                        author_id = await task
+                        if author_id is None:
+                            continue
+                        scraped_ids.add(author_id)
+                        progress_fh.write(f"{author_id}\n".encode())
+                        progress_fh.flush()
+                finally:
+                    # Stop in-flight requests before the client is closed
+                    for task in tasks:
+                        task.cancel()
                 
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, asyncio.CancelledError):
             self.logger.info("Scraping interrupted by user")
         finally:
-            # Save final progress
-            with open(progress_file, 'w', encoding='utf-8') as f:
-                json.dump(list(scraped_ids), f)
+            # Compact the log into the progress file
+            progress_fh.close()
+            compact_progress(progress_file, progress_log, scraped_ids, log_merged)
             
             self.logger.info(f"Finished scraping. Total authors scraped: {len(scraped_ids)}")
 
@@ -168,7 +242,7 @@ def main():
         client = BenYehudaAuthorScraper()
         
         # Scrape all authors
-        client.scrape_all_authors()
+        asyncio.run(client.scrape_all_authors())
             
     except Exception as e:
         print(f"Error: {str(e)}")
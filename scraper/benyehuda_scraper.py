@@ -1,18 +1,22 @@
-import requests
-import json
-from typing import Dict, Optional, List, Iterator
+import asyncio
+import httpx
+import orjson
+from typing import Dict, Optional, List, AsyncIterator, Set
 import os
 from dotenv import load_dotenv
 from pathlib import Path
-import time
 from tqdm import tqdm
 import logging
+from scraper_common import make_client, open_for_append, load_progress, compact_progress
 
 class BenYehudaAPI:
     """API client for the Ben Yehuda Project."""
     
     BASE_URL = "https://benyehuda.org/api/v1"
     BATCH_SIZE = 20  # Number of texts to fetch in each batch
+    MAX_CONCURRENCY = 10  # Number of batch requests in flight at once
+    MAX_CONNECTIONS = 20  # Size of the HTTP connection pool
+    REQUEST_TIMEOUT = 60.0  # Seconds
     
     def __init__(self, api_key: Optional[str] = None, output_dir: str = "benyehuda_data"):
         """Initialize the API client.
@@ -30,6 +34,9 @@ class BenYehudaAPI:
         self.output_dir = Path(output_dir)
         self.works_dir = self.output_dir / "works"
         self.works_dir.mkdir(parents=True, exist_ok=True)
+        # All works are appended to a single JSON Lines file, opened on first save
+        self.works_file = self.works_dir / "works.jsonl"
+        self._works_fh = None
         
         # Setup logging
         logging.basicConfig(
@@ -42,10 +49,11 @@ class BenYehudaAPI:
         )
         self.logger = logging.getLogger(__name__)
 
-    def get_texts_batch(self, text_ids: List[int], view: str = 'enriched', file_format: str = 'txt') -> List[Dict]:
+    async def get_texts_batch(self, client: httpx.AsyncClient, text_ids: List[int], view: str = 'enriched', file_format: str = 'txt') -> List[Dict]:
         """Get multiple texts in a single batch request.
         
         Args:
+            client: HTTP client to send the request with
             text_ids: List of text IDs to retrieve
             view: One of 'metadata', 'basic', or 'enriched'
             file_format: One of 'html', 'txt', 'pdf', 'epub', 'mobi', 'docx', 'odt'
@@ -61,14 +69,15 @@ class BenYehudaAPI:
             'snippet': True
         }
         
-        response = requests.post(f"{self.BASE_URL}/texts/batch", json=payload)
+        response = await client.post(f"{self.BASE_URL}/texts/batch", json=payload)
         response.raise_for_status()
-        return response.json()
+        return orjson.loads(response.content)
 
-    def search_texts(self, search_after: Optional[List[str]] = None, **kwargs) -> Dict:
+    async def search_texts(self, client: httpx.AsyncClient, search_after: Optional[List[str]] = None, **kwargs) -> Dict:
         """Search for texts using various criteria.
         
         Args:
+            client: HTTP client to send the request with
             search_after: Token for pagination
             **kwargs: Additional search parameters
             
@@ -87,22 +96,28 @@ class BenYehudaAPI:
         if search_after:
             payload['search_after'] = search_after
             
-        response = requests.post(f"{self.BASE_URL}/search", json=payload)
+        response = await client.post(f"{self.BASE_URL}/search", json=payload)
         response.raise_for_status()
-        return response.json()
+        return orjson.loads(response.content)
 
-    def get_total_works_count(self) -> int:
+    async def get_total_works_count(self, client: httpx.AsyncClient) -> int:
         """Get the total number of works available in the project.
         
+        Args:
+            client: HTTP client to send the request with
+            
         Returns:
             int: Total number of works
         """
-        results = self.search_texts()
+        results = await self.search_texts(client)
         return results.get('total_count', 0)
 
-    def get_all_works(self) -> Iterator[Dict]:
+    async def get_all_works(self, client: httpx.AsyncClient) -> AsyncIterator[Dict]:
         """Get all works from the project using pagination.
         
+        Args:
+            client: HTTP client to send the requests with
+            
         Yields:
             Dict: Work data
         """
@@ -110,7 +125,7 @@ class BenYehudaAPI:
         
         while True:
             try:
-                results = self.search_texts(search_after=search_after)
+                results = await self.search_texts(client, search_after=search_after)
 
                 if not results.get('data'):
                     break
@@ -123,14 +138,14 @@ class BenYehudaAPI:
                     break
                     
                 # Be nice to the API
-                #time.sleep(0.5)
+                #await asyncio.sleep(0.5)
                 
             except Exception as e:
                 self.logger.error(f"Error fetching page: {str(e)}")
                 break
 
     def save_work(self, work: Dict) -> None:
-        """Save a work to file.
+        """Append a work to the works file.
         
         Args:
             work: Work data to save
@@ -140,14 +155,21 @@ class BenYehudaAPI:
             self.logger.warning("Work has no ID, skipping")
             return
             
-        work_file = self.works_dir / f"work_{work_id}.json"
         try:
-            with open(work_file, 'w', encoding='utf-8') as f:
-                json.dump(work, f, ensure_ascii=False, indent=2)
+            if self._works_fh is None:
+                # A partial line left by a killed run is terminated so the next work isn't glued onto it
+                self._works_fh = open_for_append(self.works_file)
+            self._works_fh.write(orjson.dumps(work) + b'\n')
         except Exception as e:
             self.logger.error(f"Error saving work {work_id}: {str(e)}")
 
-    def process_works_batch(self, works: List[Dict], scraped_ids: set) -> List[int]:
+    def close_works_file(self) -> None:
+        """Flush and close the works file if it is open."""
+        if self._works_fh is not None:
+            self._works_fh.close()
+            self._works_fh = None
+
+    def process_works_batch(self, works: List[Dict], scraped_ids: Set[int]) -> List[int]:
         """Process a batch of works, saving only new ones.
         
         Args:
@@ -164,85 +186,112 @@ class BenYehudaAPI:
                 ids_to_fetch.append(work_id)
         return ids_to_fetch
 
-    def scrape_all_works(self) -> None:
+    async def fetch_works_batch(self, client: httpx.AsyncClient, text_ids: List[int]) -> List[int]:
+        """Fetch full details for a batch of works and save them.
+        
+        Args:
+            client: HTTP client to send the request with
+            text_ids: IDs of the works to fetch
+            
+        Returns:
+            List of IDs of the works that were saved
+        """
+        try:
+            full_works = await self.get_texts_batch(client, text_ids)
+        except Exception as e:
+            self.logger.error(f"Error processing batch: {str(e)}")
+            return []
+        finally:
+            # Be nice to the API
+            await asyncio.sleep(0.5)
+        
+        saved_ids = []
+        for full_work in full_works:
+            self.save_work(full_work)
+            work_id = full_work.get('id')
+            if work_id:
+                saved_ids.append(work_id)
+        # Make sure the works are on disk before they are marked as scraped
+        if self._works_fh is not None:
+            self._works_fh.flush()
+        return saved_ids
+
+    async def scrape_all_works(self) -> None:
         """Scrape all works from the Ben Yehuda Project."""
         self.logger.info("Starting to scrape all works...")
         
-        # Get total count for progress tracking
-        total_count = self.get_total_works_count()
-        self.logger.info(f"Found {total_count} works to scrape")
-        
-        # Create progress file to track progress
+        # Progress is appended to a log as works are scraped and compacted into the JSON file at the end
         progress_file = self.output_dir / "progress.json"
-        scraped_ids = list()
+        progress_log = self.output_dir / "progress.log"
+        # The log may only be deleted at the end once its IDs have been merged
+        scraped_ids, log_merged = load_progress(progress_file, progress_log, self.logger)
+        self.logger.info(f"Loaded {len(scraped_ids)} previously scraped works")
         
-        # Load progress if exists
-        if progress_file.exists():
-            try:
-                with open(progress_file, 'r', encoding='utf-8') as f:
-                    scraped_ids = list(json.load(f))
-                self.logger.info(f"Loaded {len(scraped_ids)} previously scraped works")
-            except Exception as e:
-                self.logger.error(f"Error loading progress file: {str(e)}")
+        # Bounds the number of batches in flight, which also throttles pagination
+        semaphore = asyncio.Semaphore(self.MAX_CONCURRENCY)
+        tasks = set()
+        
+        def on_batch_done(task: asyncio.Task) -> None:
+            semaphore.release()
+            tasks.discard(task)
+            # Batches that finish after the run has ended are picked up again on the next run
+            if task.cancelled() or progress_fh.closed:
+                return
+            saved_ids = task.result()
+            scraped_ids.update(saved_ids)
+            progress_fh.write(b''.join(f"{work_id}\n".encode() for work_id in saved_ids))
+            progress_fh.flush()
         
+        async def dispatch(works: List[Dict]) -> None:
+            # Get IDs that haven't been scraped yet
+            ids_to_fetch = self.process_works_batch(works, scraped_ids)
+            if ids_to_fetch:
+                await semaphore.acquire()
+                task = asyncio.create_task(self.fetch_works_batch(client, ids_to_fetch))
+                tasks.add(task)
+                task.add_done_callback(on_batch_done)
+        
+        progress_fh = open_for_append(progress_log, drop_partial_line=True)
         try:
-            # Buffer for collecting works to batch process
-            works_buffer = []
-            
-            for work in tqdm(self.get_all_works(), desc="Scraping works", total=total_count):
-                works_buffer.append(work)
+            async with make_client(self.MAX_CONNECTIONS, self.REQUEST_TIMEOUT) as client:
+                # Get total count for progress tracking
+                total_count = await self.get_total_works_count(client)
+                self.logger.info(f"Found {total_count} works to scrape")
                 
-                # Process in batches
-                if len(works_buffer) >= self.BATCH_SIZE:
-                    # Get IDs that haven't been scraped yet
-                    ids_to_fetch = self.process_works_batch(works_buffer, scraped_ids)
-
-                    if ids_to_fetch:
-                        try:
-                            # Fetch full details for the batch
-                            full_works = self.get_texts_batch(ids_to_fetch)
-                            
-                            # Save each work
-                            for full_work in full_works:
-                                self.save_work(full_work)
-                                work_id = full_work.get('id')
-                                if work_id:
-                                    scraped_ids.append(work_id)
-                            
-                            # Update progress file
-                            if len(scraped_ids) % (self.BATCH_SIZE * 2) == 0:
-                                with open(progress_file, 'w', encoding='utf-8') as f:
-                                    json.dump(list(scraped_ids), f)
+                try:
+                    # Buffer for collecting works to batch process
+                    works_buffer = []
+                    
+                    with tqdm(desc="Scraping works", total=total_count) as progress:
+                        async for work in self.get_all_works(client):
+                            works_buffer.append(work)
+                            progress.update(1)
                             
-                        except Exception as e:
-                            self.logger.error(f"Error processing batch: {str(e)}")
+                            # Process in batches
+                            if len(works_buffer) >= self.BATCH_SIZE:
+                                await dispatch(works_buffer)
+                                # Clear the buffer
+                                works_buffer = []
                     
-                    # Clear the buffer
-                    works_buffer = []
+                    # Process any remaining works in the buffer
+                    if works_buffer:
+                        await dispatch(works_buffer)
                     
-                    # Be nice to the API
-                    time.sleep(0.5)
-            
-            # Process any remaining works in the buffer
-            if works_buffer:
-                ids_to_fetch = self.process_works_batch(works_buffer, scraped_ids)
-                if ids_to_fetch:
-                    try:
-                        full_works = self.get_texts_batch(ids_to_fetch)
-                        for full_work in full_works:
-                            self.save_work(full_work)
-                            work_id = full_work.get('id')
-                            if work_id:
-                                scraped_ids.append(work_id)
-                    except Exception as e:
-                        self.logger.error(f"Error processing final batch: {str(e)}")
+                    # Wait for the batches still in flight
+                    if tasks:
+                        await asyncio.wait(list(tasks))
+                finally:
+                    # Stop in-flight requests before the client is closed
+                    for task in list(tasks):
+                        task.cancel()
                 
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, asyncio.CancelledError):
             self.logger.info("Scraping interrupted by user")
         finally:
-            # Save final progress
-            with open(progress_file, 'w', encoding='utf-8') as f:
-                json.dump(list(scraped_ids), f)
+            self.close_works_file()
+            # Compact the log into the progress file
+            progress_fh.close()
+            compact_progress(progress_file, progress_log, scraped_ids, log_merged)
             
             self.logger.info(f"Finished scraping. Total works scraped: {len(scraped_ids)}")
 
@@ -252,12 +301,8 @@ def main():
         # Initialize the client
         client = BenYehudaAPI()
         
-        # Get total count and start scraping
-        total_count = client.get_total_works_count()
-        print(f"\nStarting to scrape {total_count} works...")
-        
-        # Scrape all works
-        client.scrape_all_works()
+        # Scrape all works, the total count is logged once scraping starts
+        asyncio.run(client.scrape_all_works())
             
     except Exception as e:
         print(f"Error: {str(e)}")
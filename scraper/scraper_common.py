@@ -0,0 +1,130 @@
+import httpx
+import orjson
+from typing import BinaryIO, Set, Tuple
+import os
+from pathlib import Path
+import logging
+
+
+def make_client(max_connections: int, timeout: float) -> httpx.AsyncClient:
+    """Create an HTTP/2 client with a pooled set of keep-alive connections.
+
+    Args:
+        max_connections: Size of the HTTP connection pool
+        timeout: Request timeout in seconds
+    """
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=max_connections),
+        timeout=timeout
+    )
+
+def open_for_append(path: Path, drop_partial_line: bool = False) -> BinaryIO:
+    """Open a line-oriented file for appending.
+
+    If an earlier run was killed mid-write the file ends in a partial line. It is terminated first
+    so that the next record is not glued onto it, or removed if `drop_partial_line` is set.
+
+    Args:
+        path: Path of the file to append to
+        drop_partial_line: Truncate a trailing partial line instead of terminating it. Used for
+            progress logs, where a cut-off ID would otherwise read back as a different, valid ID.
+
+    Returns:
+        File handle opened in binary append mode
+    """
+    if drop_partial_line and path.exists():
+        with open(path, 'r+b') as f:
+            size = f.seek(0, os.SEEK_END)
+            # Progress log lines are short, the last newline is always within the tail
+            tail_start = max(0, size - 4096)
+            f.seek(tail_start)
+            tail = f.read()
+            if tail and not tail.endswith(b'\n'):
+                f.truncate(tail_start + tail.rfind(b'\n') + 1)
+    fh = open(path, 'ab')
+    if fh.tell() > 0:
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                fh.write(b'\n')
+    return fh
+
+def read_progress_log(progress_log: Path, logger: logging.Logger) -> Set[int]:
+    """Read the IDs appended to a progress log.
+
+    Args:
+        progress_log: Path of the progress log
+        logger: Logger to report malformed lines to
+
+    Returns:
+        Set[int]: IDs recorded in the log, skipping a last line cut off by a killed run
+    """
+    ids = set()
+    with open(progress_log, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n') or not line.strip():
+                continue
+            try:
+                ids.add(int(line))
+            except ValueError:
+                logger.warning(f"Skipping malformed line in {progress_log}: {line!r}")
+    return ids
+
+def load_progress(progress_file: Path, progress_log: Path, logger: logging.Logger) -> Tuple[Set[int], bool]:
+    """Load the IDs scraped by previous runs from the progress file and the progress log.
+
+    The two are read independently, so a broken progress file doesn't lose the log.
+
+    Args:
+        progress_file: Path of the compacted progress file
+        progress_log: Path of the append-only progress log
+        logger: Logger to report errors to
+
+    Returns:
+        The scraped IDs, and whether the log was merged into them. A log that could not be
+        read must be kept for the next run.
+    """
+    scraped_ids = set()
+    if progress_file.exists():
+        try:
+            scraped_ids = set(orjson.loads(progress_file.read_bytes()))
+        except Exception as e:
+            logger.error(f"Error loading progress file: {str(e)}")
+    log_merged = True
+    if progress_log.exists():
+        try:
+            scraped_ids.update(read_progress_log(progress_log, logger))
+        except Exception as e:
+            log_merged = False
+            logger.error(f"Error loading progress log, keeping it for the next run: {str(e)}")
+    return scraped_ids, log_merged
+
+def save_progress(progress_file: Path, scraped_ids: Set[int]) -> None:
+    """Atomically replace the progress file with the given IDs.
+
+    The IDs are written to a temporary file which is then renamed over the progress file,
+    so an interrupted write never leaves a truncated progress file behind.
+
+    Args:
+        progress_file: Path of the progress file
+        scraped_ids: IDs scraped so far
+    """
+    tmp_file = progress_file.with_suffix('.tmp')
+    with open(tmp_file, 'wb') as f:
+        f.write(orjson.dumps(list(scraped_ids)))
+    os.replace(tmp_file, progress_file)
+
+def compact_progress(progress_file: Path, progress_log: Path, scraped_ids: Set[int], log_merged: bool) -> None:
+    """Fold the progress log into the progress file.
+
+    Args:
+        progress_file: Path of the compacted progress file
+        progress_log: Path of the append-only progress log
+        scraped_ids: All IDs scraped so far
+        log_merged: Whether the log read at startup was merged into `scraped_ids`. If not, the log
+            still holds IDs that are missing from `scraped_ids` and is kept.
+    """
+    save_progress(progress_file, scraped_ids)
+    if log_merged:
+        progress_log.unlink(missing_ok=True)
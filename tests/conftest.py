@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# The dataset module lives at the repository root, the scraper modules are run as scripts from scraper/
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / 'scraper'))
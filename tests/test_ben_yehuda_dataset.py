@@ -0,0 +1,133 @@
+import json
+import pickle
+
+import pytest
+
+import ben_yehuda_dataset
+from ben_yehuda_dataset import BenYehudaDataset, MMAP_MIN_SIZE
+
+AUTHOR_NAME = 'אביגדור המאירי'
+# Mixes \r\n and a lone \r, and is large enough to go through the mmap path
+CRLF_TEXT = 'שורה אחת\r\nשורה שתיים\rשורה שלוש\r\n' * (MMAP_MIN_SIZE // 16)
+
+
+def _write_corpus(root, text=CRLF_TEXT, encoding='utf-8'):
+    authors_dir = root / 'authors'
+    authors_dir.mkdir()
+    author = {'id': 10, 'metadata': {'name': AUTHOR_NAME,
+                                     'person': {'birth_year': '1890', 'death_year': '1970'}}}
+    (authors_dir / 'author_10.json').write_text(json.dumps(author, ensure_ascii=False), encoding='utf-8')
+
+    txt_dir = root / 'txt'
+    (txt_dir / 'p10').mkdir(parents=True)
+    txt_file = txt_dir / 'p10' / 'm1.txt'
+    txt_file.write_bytes(text.encode(encoding))
+
+    pseudocatalogue = root / 'pseudocatalogue.csv'
+    pseudocatalogue.write_bytes(f'path,authors\n/p10/m1,{AUTHOR_NAME}\n'.encode(encoding))
+    return pseudocatalogue, authors_dir, txt_dir, txt_file
+
+
+def _statistics(dataset, monkeypatch, capsys):
+    """Run print_dataset_statistics without plotting and return its word and character totals."""
+    monkeypatch.setattr(ben_yehuda_dataset, 'plot_dataset_statistics', lambda *_: None)
+    capsys.readouterr()
+    ben_yehuda_dataset.print_dataset_statistics(dataset)
+    lines = capsys.readouterr().out.splitlines()
+    totals = {line.split(':')[0]: int(line.split(':')[1]) for line in lines if line.startswith('Total number of')}
+    return totals['Total number of words'], totals['Total number of characters']
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    return _write_corpus(tmp_path)
+
+
+@pytest.mark.parametrize('use_mmap', [True, False])
+def test_getitem_translates_newlines_like_text_mode(corpus, use_mmap):
+    pseudocatalogue, authors_dir, txt_dir, txt_file = corpus
+    dataset = BenYehudaDataset(str(pseudocatalogue), str(authors_dir), str(txt_dir), use_mmap=use_mmap)
+
+    with txt_file.open(encoding='utf-8') as f:
+        expected = f.read()
+    text, years = dataset[0]
+    assert text == expected
+    assert '\r' not in text
+    assert years == (1890, 1970)
+
+
+def test_arena_dataset_survives_pickling(corpus, tmp_path):
+    pseudocatalogue, authors_dir, txt_dir, _ = corpus
+    dataset = BenYehudaDataset(str(pseudocatalogue), str(authors_dir), str(txt_dir), arena_dir=str(tmp_path / 'arena'))
+    expected = dataset[0]
+
+    restored = pickle.loads(pickle.dumps(dataset))
+    assert restored[0] == expected
+
+
+def test_index_cache_does_not_build_arena(corpus, tmp_path):
+    pseudocatalogue, authors_dir, txt_dir, _ = corpus
+    cache_dir = tmp_path / 'cache'
+    BenYehudaDataset(str(pseudocatalogue), str(authors_dir), str(txt_dir), cache_dir=str(cache_dir))
+    dataset = BenYehudaDataset(str(pseudocatalogue), str(authors_dir), str(txt_dir), cache_dir=str(cache_dir))
+
+    assert [p.name.split('_')[0] for p in cache_dir.iterdir()] == ['index']
+    assert dataset.arena is None
+    assert dataset.paths == ['p10/m1.txt']
+
+
+@pytest.mark.parametrize('return_bytes', [False, True])
+@pytest.mark.parametrize('use_arena', [True, False])
+def test_statistics_count_characters_like_text_mode(corpus, tmp_path, monkeypatch, use_arena, return_bytes):
+    pseudocatalogue, authors_dir, txt_dir, _ = corpus
+    arena_dir = str(tmp_path / 'arena') if use_arena else None
+    dataset = BenYehudaDataset(str(pseudocatalogue), str(authors_dir), str(txt_dir), arena_dir=arena_dir,
+                               return_bytes=return_bytes)
+    text_dataset = BenYehudaDataset(str(pseudocatalogue), str(authors_dir), str(txt_dir))
+
+    plotted = {}
+    monkeypatch.setattr(ben_yehuda_dataset, 'plot_dataset_statistics',
+                        lambda text_lengths, *_: plotted.setdefault('text_lengths', list(text_lengths)))
+    ben_yehuda_dataset.print_dataset_statistics(dataset)
+    assert plotted['text_lengths'] == [len(text_dataset[0][0])]
+
+
+@pytest.mark.parametrize('scan_txt_dir', [True, False])
+def test_symlinked_directories_are_followed(corpus, tmp_path, scan_txt_dir):
+    pseudocatalogue, authors_dir, txt_dir, _ = corpus
+    linked_dir = tmp_path / 'linked_txt'
+    linked_dir.mkdir()
+    (linked_dir / 'p10').symlink_to(txt_dir / 'p10', target_is_directory=True)
+    # A cycle back to the root must not make the walk loop forever
+    (linked_dir / 'loop').symlink_to(linked_dir, target_is_directory=True)
+
+    dataset = BenYehudaDataset(str(pseudocatalogue), str(authors_dir), str(linked_dir), scan_txt_dir=scan_txt_dir)
+    assert dataset.paths == ['p10/m1.txt']
+
+
+@pytest.mark.parametrize('text', [
+    CRLF_TEXT,
+    'שלום, עולם! "ציטוט" (בסוגריים) -- מקף\tטאב\x0bואנכי\x1cמפריד\n',
+    '   רווחים בהתחלה ובסוף   ',
+    'a-b_c.d...e',
+    '',
+])
+def test_arena_statistics_match_split(corpus, tmp_path, monkeypatch, capsys, text):
+    _, _, _, txt_file = corpus
+    txt_file.write_bytes(text.encode('utf-8'))
+    pseudocatalogue, authors_dir, txt_dir, _ = corpus
+
+    plain = BenYehudaDataset(str(pseudocatalogue), str(authors_dir), str(txt_dir))
+    arena = BenYehudaDataset(str(pseudocatalogue), str(authors_dir), str(txt_dir), arena_dir=str(tmp_path / 'arena'))
+    assert _statistics(arena, monkeypatch, capsys) == _statistics(plain, monkeypatch, capsys)
+
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'utf-8-sig', 'utf-16', 'cp1255'])
+def test_arena_statistics_match_split_for_encoding(tmp_path, monkeypatch, capsys, encoding):
+    text = 'שלום,\xa0עולם!\r\nשורה שנייה\n' * 10
+    pseudocatalogue, authors_dir, txt_dir, _ = _write_corpus(tmp_path, text, encoding)
+
+    plain = BenYehudaDataset(str(pseudocatalogue), str(authors_dir), str(txt_dir), encoding=encoding)
+    arena = BenYehudaDataset(str(pseudocatalogue), str(authors_dir), str(txt_dir), encoding=encoding,
+                             arena_dir=str(tmp_path / 'arena'))
+    assert _statistics(arena, monkeypatch, capsys) == _statistics(plain, monkeypatch, capsys)
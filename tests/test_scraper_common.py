@@ -0,0 +1,100 @@
+import logging
+
+import orjson
+
+from scraper_common import compact_progress, load_progress, open_for_append, read_progress_log
+
+logger = logging.getLogger(__name__)
+
+
+def test_open_for_append_drops_partial_progress_line(tmp_path):
+    progress_log = tmp_path / 'progress.log'
+    # A run killed while writing "123\n" left a cut-off ID behind
+    progress_log.write_bytes(b'1\n2\n12')
+
+    with open_for_append(progress_log, drop_partial_line=True) as fh:
+        fh.write(b'3\n')
+
+    assert progress_log.read_bytes() == b'1\n2\n3\n'
+    assert read_progress_log(progress_log, logger) == {1, 2, 3}
+
+
+def test_open_for_append_drops_partial_first_line(tmp_path):
+    progress_log = tmp_path / 'progress.log'
+    progress_log.write_bytes(b'12')
+
+    with open_for_append(progress_log, drop_partial_line=True) as fh:
+        fh.write(b'3\n')
+
+    assert progress_log.read_bytes() == b'3\n'
+
+
+def test_open_for_append_terminates_partial_line(tmp_path):
+    works_file = tmp_path / 'works.jsonl'
+    works_file.write_bytes(b'{"id": 1}\n{"id": 2, "meta')
+
+    with open_for_append(works_file) as fh:
+        fh.write(b'{"id": 3}\n')
+
+    assert works_file.read_bytes().splitlines() == [b'{"id": 1}', b'{"id": 2, "meta', b'{"id": 3}']
+
+
+def test_read_progress_log_skips_partial_last_line(tmp_path):
+    progress_log = tmp_path / 'progress.log'
+    progress_log.write_bytes(b'1\n\n2\n34')
+
+    assert read_progress_log(progress_log, logger) == {1, 2}
+
+
+def test_read_progress_log_warns_about_malformed_lines(tmp_path, caplog):
+    progress_log = tmp_path / 'progress.log'
+    progress_log.write_bytes(b'1\nnot-an-id\n2\n')
+
+    with caplog.at_level(logging.WARNING):
+        assert read_progress_log(progress_log, logger) == {1, 2}
+    assert "Skipping malformed line" in caplog.text
+    assert "not-an-id" in caplog.text
+
+
+def test_load_progress_reads_log_when_progress_file_is_broken(tmp_path):
+    progress_file = tmp_path / 'progress.json'
+    progress_log = tmp_path / 'progress.log'
+    progress_file.write_bytes(b'[1, 2')
+    progress_log.write_bytes(b'3\n4\n')
+
+    scraped_ids, log_merged = load_progress(progress_file, progress_log, logger)
+
+    assert scraped_ids == {3, 4}
+    assert log_merged
+
+
+def test_compact_progress_removes_merged_log(tmp_path):
+    progress_file = tmp_path / 'progress.json'
+    progress_log = tmp_path / 'progress.log'
+    progress_file.write_bytes(b'[1]')
+    progress_log.write_bytes(b'2\n')
+
+    scraped_ids, log_merged = load_progress(progress_file, progress_log, logger)
+    compact_progress(progress_file, progress_log, scraped_ids, log_merged)
+
+    assert set(orjson.loads(progress_file.read_bytes())) == {1, 2}
+    assert not progress_log.exists()
+    assert not progress_file.with_suffix('.tmp').exists()
+
+
+def test_compact_progress_keeps_log_when_merge_failed(tmp_path, monkeypatch):
+    progress_file = tmp_path / 'progress.json'
+    progress_log = tmp_path / 'progress.log'
+    progress_file.write_bytes(b'[1]')
+    progress_log.write_bytes(b'2\n')
+
+    def unreadable(*_):
+        raise OSError("I/O error")
+    monkeypatch.setattr('scraper_common.read_progress_log', unreadable)
+
+    scraped_ids, log_merged = load_progress(progress_file, progress_log, logger)
+    assert scraped_ids == {1}
+    assert not log_merged
+
+    compact_progress(progress_file, progress_log, scraped_ids, log_merged)
+    assert progress_log.read_bytes() == b'2\n'